@@ -20,4 +20,5 @@ def compartmentalize_and_compile_contracts(inputDir, outputDir, contractName, gr
 
 if __name__ == "__main__":
     inputDir, outputDir, contractName, graph, debug = parseArg(sys.argv[1:])
-    compartmentalize_and_compile_contracts(inputDir, outputDir, contractName, graph, debug)
\ No newline at end of file
+    if not compartmentalize_and_compile_contracts(inputDir, outputDir, contractName, graph, debug):
+        sys.exit(1)
\ No newline at end of file
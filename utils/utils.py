@@ -2,14 +2,54 @@ import getopt
 import subprocess
 import sys
 import os, json, re
+import functools
+import concurrent.futures
+import mmap
 from solidity_parser import parser
-from graphviz import Digraph
-import time
+from graphviz import Source
 import logging
 from termcolor import colored
 
 logging.basicConfig(level=logging.INFO)
 
+## matches "pragma solidity ^0.8", ">=0.5.0 <0.6.0", "= 0.4.24", with or without spaces
+PRAGMA_RE = re.compile(rb'pragma\s+solidity[^;]*?(\d+\.\d+(?:\.\d+)?)')
+## the whole version constraint of a pragma, e.g. "^0.4.24" or ">=0.5.0 <0.6.0"
+VERSION_RE = re.compile(r'pragma\s+solidity\s*([^;]+?)\s*;')
+WHITESPACE_RE = re.compile(r'\s+')
+## matches 'import "a.sol";', 'import {A} from "a.sol";', 'import * as A from "a.sol";'
+IMPORT_RE = re.compile(r'''import\s+(?:(?:\{[^}]*\}|\*\s+as\s+\w+|\w+)\s+from\s+)?["']([^"']+)["']''')
+COMMENT_RE = re.compile(r'//.*?$|/\*.*?\*/', re.MULTILINE | re.DOTALL)
+## pragma directives sit at the top of a file, so parseVersion reads only this many characters first
+HEADER_SIZE = 2048
+## bare version number, e.g. "0.4.24" out of "^0.4.24"
+VERSION_NUM_RE = re.compile(r'0\.[0-9]+(?:\.[0-9]+)?')
+## comments (group 1), pragma directives (group 2) and import statements (group 3) seen by getPackedContract in one scan,
+## including 'pragma solidity^0.8.0;' and 'import "a.sol" as A;'
+PACK_RE = re.compile('(' + COMMENT_RE.pattern + r')|(pragma\s+solidity\s*[^;]+;)|' + IMPORT_RE.pattern + r'(?:\s+as\s+\w+)?\s*;',
+                     re.MULTILINE | re.DOTALL)
+
+'''
+#  memoizes a per-path helper on the absolute path, checked against the file's mtime and size.
+# Why: The same .sol files are parsed by several helpers in one run; each file should only be parsed once.
+# Subtleties: An edited file gets a new mtime or size and is re-parsed, replacing its old entry; the debug flag is not part of the key.
+# Possible bugs: The cached value is shared between callers, so callers must not mutate it.
+'''
+def memoizeByPath(func):
+    cache = dict()
+    @functools.wraps(func)
+    def wrapper(path, debug=False):
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = cache.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, func(path, debug))
+            cache[key] = cached
+        return cached[1]
+    wrapper.cache = cache
+    return wrapper
+
 '''
 #  parses command line arguments.
 # Why: Command line arguments are used to specify the input directory, output directory, contract name, and other options.
@@ -56,105 +96,229 @@ def parseArg(argv):
     return inputDir, outputDir, contractName, graph, debug
 
 '''
-#  parses the Solidity version from a file using readline.
+#  parses the Solidity version number from a file, or "unknown version".
 # Why: The Solidity version is needed to compile the contract.
-# Subtleties: If the version is not found, "unknown version" is returned.
+# Subtleties: The head of the file is searched first; the rest is mmapped only on a miss.
 # Possible bugs: If the version is not specified in the expected format, it may not be correctly identified.
 '''
 def parseVersionReadline(filePath, debug=False):
     if debug: logging.info(colored('Parsing solidity version by readline...', 'green'))
-    f = open(filePath)
-    line = f.readline()
-    while line:
-        if re.search('pragma', line) != None and re.search('0\.[0-9\.]*', line) != None:
-            return re.search('0\.[0-9\.]*', line).group(0)
-        line = f.readline()
-    f.close()
+    version = "unknown version"
+    with open(filePath, 'rb') as f:
+        head = f.read(HEADER_SIZE)
+        m = PRAGMA_RE.search(head)
+        ## a match touching the end of the head may be a cut off version
+        if m is not None and m.end() < len(head):
+            version = m.group(1).decode()
+        elif os.fstat(f.fileno()).st_size > len(head):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                m = PRAGMA_RE.search(mm)
+                if m is not None:
+                    version = m.group(1).decode()
+        elif m is not None:
+            version = m.group(1).decode()
     if debug: logging.info(colored('Solidity version parsed successfully.', 'green'))
-    return "unknown version"
+    return version
 
 '''
-#  parses the Solidity version from a .sol file.
+#  reads the source of a .sol file with comments stripped.
+# Why: Commented-out pragmas and imports must not be picked up by the regex based parsers.
+# Subtleties: Undecodable bytes are dropped; with size, only the head of the file is read.
+# Possible bugs: A "//" or "/*" inside a string literal is treated as the start of a comment.
+'''
+def readSource(filePath, size=-1):
+    with open(filePath, 'r', encoding='utf-8', errors='ignore') as f:
+        text = f.read(size)
+    text = COMMENT_RE.sub('', text)
+    if size >= 0:
+        ## drop a block comment cut off by the partial read
+        text = text.split('/*', 1)[0]
+    return text
+
+'''
+#  parses the Solidity version constraint (e.g. "^0.4.24") from a .sol file, or "unknown version".
 # Why: The Solidity version is needed to compile the contract.
-# Subtleties: If the version is not found, the function falls back to parseVersionReadline.
+# Subtleties: A regex over the comment-stripped head of the file is tried first, then the whole file.
 # Possible bugs: If the version is not specified in the expected format, it may not be correctly identified.
 '''
+@memoizeByPath
 def parseVersion(filePath, debug=False):
     if debug: logging.info(colored('Parsing solidity version from .sol file...', 'green'))
+    head = readSource(filePath, HEADER_SIZE)
+    m = VERSION_RE.search(head)
+    ## a match touching the end of the head may be a cut off version
+    if (m is None or m.end() == len(head)) and os.path.getsize(filePath) > HEADER_SIZE:
+        m = VERSION_RE.search(readSource(filePath))
+    if m is None:
+        return "unknown version"
+    if debug: logging.info(colored('Solidity version parsed successfully.', 'green'))
+    ## solidity_parser joins the parts of a constraint without spaces
+    return WHITESPACE_RE.sub('', m.group(1))
+
+'''
+#  parses (version, import file list) of a .sol file with one solidity_parser run.
+# Why: The AST parse is kept for debugging the regex based parsers.
+# Subtleties: If the file cannot be parsed, the version falls back to parseVersionReadline and the import list is empty.
+# Possible bugs: The AST parse is slow; do not use it on hot paths.
+'''
+@memoizeByPath
+def parseVersionAndImportsAst(filePath, debug=False):
+    if debug: logging.info(colored('Parsing solidity version and import file list from .sol AST...', 'green'))
     try:
         fileUnits = parser.parse_file(filePath, loc=False)
     except Exception as e:
-        logging.error('Error parsing solidity version from .sol file.')
-        return parseVersionReadline(filePath)
-    for item in fileUnits["children"]:
-        if item["type"] == "PragmaDirective":
-            if debug: logging.info(colored('Solidity version parsed successfully.', 'green'))
-            return item["value"]
-    if debug: logging.info(colored('Solidity version parsed successfully.', 'green'))
-    return "unknown version"
+        logging.error('Error parsing .sol file.')
+        return parseVersionReadline(filePath), []
+    version = "unknown version"
+    imports = []
+    try:
+        for item in fileUnits["children"]:
+            if item["type"] == "PragmaDirective" and version == "unknown version":
+                version = item["value"]
+            elif item["type"] == "ImportDirective":
+                imports.append(item["path"])
+    except Exception as e:
+        logging.error(filePath)
+    if debug: logging.info(colored('Solidity version and import file list parsed successfully.', 'green'))
+    return version, imports
+
+'''
+parse solidity version from the AST
+'''
+def parseVersionAst(filePath, debug=False):
+    version, _ = parseVersionAndImportsAst(filePath, debug)
+    return version
+
+## solc version last selected by switchVersion
+currentSolcVersion = None
 
 '''
 #  switches the solc version using solc-select.
 # Why: Different contracts may require different versions of the Solidity compiler.
-# Subtleties: The function sleeps for 5 seconds after switching versions to ensure the change takes effect.
+# Subtleties: Nothing is done if the version is already selected by a previous call.
 # Possible bugs: If solc-select is not installed or not working correctly, this function will not work.
 '''
 def switchVersion(version, debug=False):
+    global currentSolcVersion
     if debug: logging.info(colored('Switching solc version...', 'green'))
-    cleanVersion = re.search('0\.[0-9\.]*', version).group(0)
+    cleanVersion = VERSION_NUM_RE.search(version).group(0)
+    if cleanVersion == currentSolcVersion:
+        return
     check_and_install_solc_version(cleanVersion)
-    os.system("solc-select use " + cleanVersion)
-    time.sleep(5)
+    ## solc-select writes the global version before it exits, no need to wait
+    try:
+        returncode = subprocess.run(["solc-select", "use", cleanVersion]).returncode
+    except OSError as e:
+        logging.error(f"Unable to run solc-select: {e}")
+        return
+    if returncode != 0:
+        logging.warning(f"solc-select could not switch to version {cleanVersion}")
+        return
+    currentSolcVersion = cleanVersion
     if debug: logging.info(colored('Solc version switched successfully.', 'green'))
 
 '''
 #  parses a list of contracts with absolute paths.
 # Why: The list of contracts is needed to compile the DApp.
-# Subtleties: The function recursively searches directories for .sol files.
+# Subtleties: os.scandir with an explicit stack is used, so files need no extra stat; symlinked directories are not followed.
 # Possible bugs: If a .sol file is not a contract, it will still be included in the list.
 '''
 def parseContractList(inputDir, debug=False):
     if debug: logging.info(colored('Parsing contract list with absolute path...', 'green'))
     result = dict()
-    inputFiles = os.listdir(inputDir)
-    for inputFile in inputFiles:
-        targetPath = os.path.join(inputDir, inputFile)
-        targetPath = os.path.abspath(targetPath)
-        if (not os.path.isdir(targetPath)) \
-                and re.match("[\S]*.sol$", inputFile) != None:
-            result[targetPath] = inputFile
-        elif os.path.isdir(targetPath):
-            nestResult = parseContractList(targetPath)
-            for key, value in nestResult.items():
-                result[key] = value
+    stack = [os.path.abspath(inputDir)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".sol"):
+                    result[entry.path] = entry.name
     if debug: logging.info(colored('Contract list parsed successfully.', 'green'))
     return result
 
+'''
+#  drops the cached real paths and import graphs.
+# Why: Frees the memory of input dirs that are no longer used.
+# Subtleties: Edited contracts are noticed by their mtime and size without calling this.
+# Possible bugs: None known.
+'''
+def invalidateCaches():
+    dependencyEdgesCache.clear()
+    cachedRealPath.cache_clear()
+
+'''
+#  resolves a path to its real path.
+# Why: The same imports are resolved from many contracts.
+# Subtleties: Results are kept until invalidateCaches is called.
+# Possible bugs: A symlink changed during a run is not noticed.
+'''
+@functools.lru_cache(maxsize=None)
+def cachedRealPath(path):
+    return os.path.realpath(path)
+
 '''
 #  parses a list of imported files in relative paths.
 # Why: The list of imported files is needed to compile the DApp.
-# Subtleties: If an import statement cannot be parsed, an empty list is returned.
+# Subtleties: A regex over the comment-stripped source is used instead of a full AST parse.
 # Possible bugs: If an import statement is not in the expected format, it may not be correctly identified.
 '''
+@memoizeByPath
 def parseImportList(filePath, debug=False):
     if debug: logging.info(colored('Parsing import file list in relative path...', 'green'))
-    try:
-        fileUnits = parser.parse_file(filePath, loc=False)
-    except Exception as e:
-        logging.error('Error parsing import file list in relative path.')
-        return []
-    result = []
-    try:
-        for item in fileUnits["children"]:
-            if item["type"] == "ImportDirective":
-                result.append(item["path"])
-    except Exception as e:
-        logging.error(filePath)
+    result = IMPORT_RE.findall(readSource(filePath))
     if debug: logging.info(colored('Import file list parsed successfully.', 'green'))
     return result
 
 '''
-#  draws a dependency graph of the contracts.
+parse import file list from the AST
+'''
+def parseImportListAst(filePath, debug=False):
+    _, imports = parseVersionAndImportsAst(filePath, debug)
+    return imports
+
+## import graphs keyed by the tuple of contract paths, stored with their (mtime, size) stamps
+dependencyEdgesCache = dict()
+
+'''
+#  returns the imports of every contract as (import file, matching contract or joined path) pairs.
+# Why: parseDependency, getLeafNode and calculateImportLib share one import graph per contract list.
+# Subtleties: The graph is rebuilt when the mtime or size of any contract changes.
+# Possible bugs: Imports that match no contract have to be checked by the caller.
+'''
+def buildDependencyEdges(contractList):
+    contractPaths = tuple(contractList)
+    stamps = []
+    for path in contractPaths:
+        stat = os.stat(path)
+        stamps.append((stat.st_mtime_ns, stat.st_size))
+    stamps = tuple(stamps)
+    cached = dependencyEdgesCache.get(contractPaths)
+    if cached is not None and cached[0] == stamps:
+        return cached[1]
+    canonicalPaths = {cachedRealPath(path): path for path in contractPaths}
+    edges = dict()
+    for path in contractPaths:
+        dirName = os.path.dirname(path)
+        resolved = []
+        for importFile in parseImportList(path):
+            joinedPath = os.path.join(dirName, importFile)
+            resolved.append((importFile, canonicalPaths.get(cachedRealPath(joinedPath), joinedPath)))
+        edges[path] = resolved
+    dependencyEdgesCache[contractPaths] = (stamps, edges)
+    return edges
+
+'''
+#  quotes a node name or label for a DOT source.
+# Why: Node names are paths, which DOT only accepts quoted.
+# Subtleties: Every ID is quoted.
+# Possible bugs: None known.
+'''
+def quoteDot(text):
+    return '"%s"' % text.replace('"', '\\"')
+
+'''
+#  draws a dependency graph of the contracts and returns it as a graphviz Source.
 # Why: The dependency graph is useful for understanding the structure of the DApp.
 # Subtleties: If a contract imports a file that does not exist, a node with label "404" is added to the graph.
 # Possible bugs: If a contract imports a file that is not a contract, it will still be included in the graph.
@@ -162,25 +326,20 @@ def parseImportList(filePath, debug=False):
 def parseDependency(inputDir, outputDir, graph, debug=False):
     if debug: logging.info(colored('Drawing dependency graph...', 'green'))
     result = parseContractList(inputDir)
-    dot = Digraph(comment="The Dependency Graph", node_attr={'shape': 'record'})
+    edges = buildDependencyEdges(result)
+    versions = {path: parseVersion(path) for path in result}
+    lines = ["// The Dependency Graph", "digraph {", "\tnode [shape=record]"]
     ## add node from the contract list
     for path, name in result.items():
-        dot.node(name = path, label = "{%s|path: %s|version: %s}"%(name, path, parseVersion(path)))
+        lines.append("\t%s [label=%s]"%(quoteDot(path), quoteDot("{%s|path: %s|version: %s}"%(name, path, versions[path]))))
     ## add graph from the import list
     for path, name in result.items():
-        importFiles = parseImportList(path)
-        dirName = os.path.dirname(path)
-        for importFile in importFiles:
-            realPath = os.path.join(dirName, importFile)
-            for key in result.keys():
-                if os.path.exists(realPath) and os.path.samefile(key, realPath):
-                    realPath = key
-                    break
-            if realPath in result:
-                dot.edge(realPath, path)
-            else:
-                dot.node(name = realPath, label = "{404|path: %s}"%realPath)
-                dot.edge(realPath, path)
+        for _, realPath in edges[path]:
+            if realPath not in result:
+                lines.append("\t%s [label=%s]"%(quoteDot(realPath), quoteDot("{404|path: %s}"%realPath)))
+            lines.append("\t%s -> %s"%(quoteDot(realPath), quoteDot(path)))
+    lines.append("}")
+    dot = Source("\n".join(lines) + "\n")
     if graph:
         dot.render(os.path.join(outputDir, "DependencyGraph.gv"), format='png', view=True)
     if debug: logging.info(colored('Dependency graph drawn successfully.', 'green'))
@@ -192,23 +351,17 @@ def parseDependency(inputDir, outputDir, graph, debug=False):
 # Subtleties: The function counts the out degree of each node to determine if it is a leaf node.
 # Possible bugs: If a contract imports a file that is not a contract, it may be incorrectly identified as a leaf node.
 '''
-def getLeafNode(inputDir, debug=False):
+def getLeafNode(inputDir, debug=False, contractList=None):
     if debug: logging.info(colored('Getting leaf node of dependency graph...', 'green'))
-    result = parseContractList(inputDir)
+    result = contractList if contractList is not None else parseContractList(inputDir)
+    edges = buildDependencyEdges(result)
     nodeList = dict()
     ## add node from the contract list
     for path, name in result.items():
         nodeList[path] = 0
     ## calculate out degree of each node
     for path, name in result.items():
-        importFiles = parseImportList(path)
-        dirName = os.path.dirname(path)
-        for importFile in importFiles:
-            realPath = os.path.join(dirName, importFile)
-            for key in result.keys():
-                if os.path.exists(realPath) and os.path.samefile(key, realPath):
-                    realPath = key
-                    break
+        for _, realPath in edges[path]:
             if realPath in result:
                 nodeList[realPath] += 1
     if debug: logging.info(colored('Leaf node of dependency graph obtained successfully.', 'green'))
@@ -220,38 +373,38 @@ compile DApp
 def compileLeafNodes(inputDir, outputDir, debug=False):
     if debug: logging.info(colored('Compiling DApp...', 'green'))
     ## get leaf node (contract)
-    nodeList = getLeafNode(inputDir)
+    contractList = parseContractList(inputDir)
+    nodeList = getLeafNode(inputDir, contractList=contractList)
     leafNodes = []
     for path, outDegree in nodeList.items():
         if outDegree == 0:
             leafNodes.append(path)
-    ## compile leaf node
+    basePath = os.path.join(os.path.dirname(inputDir), "node_modules")
+    ## group leaf node by solc version
+    versionGroups = dict()
     for leafNode in leafNodes:
         (_, contractName) = os.path.split(leafNode)
-        targetPath = os.path.join(outputDir, contractName[:len(contractName) - 4] + ".json")
-        if os.path.exists(targetPath) and os.path.getsize(targetPath):
+        targetPath = os.path.join(outputDir, os.path.splitext(contractName)[0] + ".json")
+        if isCompiled(leafNode, targetPath, basePath):
             continue
         version = parseVersion(leafNode)
         if version == "unknown version":
             logging.error(f"Unable to identify solidity version of {contractName}")
             continue
-        switchVersion(version)
-        basePath = os.path.join(os.path.dirname(inputDir), "node_modules")
-        if not os.path.exists(basePath):
-            os.mkdir(basePath)
-        _, _, importLibs = calculateImportLib(inputDir)
-        compileCommand = "solc --combined-json abi,bin,bin-runtime,srcmap,srcmap-runtime,ast "
-        for importLib in importLibs:
-            libs = importLib.split("/")
-            if libs[0] == ".":
-                continue
-            compileCommand = compileCommand + libs[0] + "=" + os.path.join(basePath, libs[0]) + " "
-        compileCommand = compileCommand \
-                    + leafNode + " > " \
-                    + targetPath \
-                    + " --allow-paths " \
-                    + os.path.dirname(inputDir)
-        os.system(compileCommand)
+        versionGroups.setdefault(version, []).append((leafNode, targetPath))
+    if not versionGroups:
+        if debug: logging.info(colored('All leaf nodes are compiled already.', 'green'))
+        return
+    ## import libs are the same for every leaf node
+    _, _, importLibs = calculateImportLib(inputDir, contractList, debug)
+    if not os.path.exists(basePath):
+        os.mkdir(basePath)
+    remappings = buildRemappings(importLibs, basePath)
+    ## compile leaf node, all solc versions side by side
+    failed = compileVersionGroups(versionGroups, remappings, inputDir, debug)
+    if failed:
+        logging.error("Unable to compile %s", ", ".join(os.path.splitext(os.path.basename(targetPath))[0] + ".sol" for targetPath in failed))
+        return
     if debug: logging.info(colored('DApp compiled successfully.', 'green'))
 
 def compileDapp(inputDir, outputDir, debug=False):
@@ -259,54 +412,204 @@ def compileDapp(inputDir, outputDir, debug=False):
         if debug: logging.info(colored('Compiling DApp...', 'green'))
         ## get all node (contract)
         contractList = parseContractList(inputDir)
-        ## compile each contract
+        basePath = os.path.join(os.path.dirname(inputDir), "node_modules")
+        ## group contracts by solc version
+        versionGroups = dict()
         for contractPath, contractName in contractList.items():
-            print('hello')
-            targetPath = os.path.join(outputDir, contractName[:len(contractName) - 4] + ".json")
-            if os.path.exists(targetPath) and os.path.getsize(targetPath):
+            targetPath = os.path.join(outputDir, os.path.splitext(contractName)[0] + ".json")
+            if isCompiled(contractPath, targetPath, basePath):
                 continue
             version = parseVersion(contractPath)
             if version == "unknown version":
-                logging.error("Unable to identify solidity version of", contractName)
+                logging.error("Unable to identify solidity version of %s", contractName)
                 continue
-            switchVersion(version)
-            basePath = os.path.join(os.path.dirname(inputDir), "node_modules")
-            if not os.path.exists(basePath):
-                os.mkdir(basePath)
-            _, _, importLibs = calculateImportLib(inputDir)
-            compileCommand = "solc --combined-json abi,bin,bin-runtime,srcmap,srcmap-runtime,ast "
-            for importLib in importLibs:
-                libs = importLib.split("/")
-                if libs[0] == ".":
-                    continue
-                compileCommand = compileCommand + libs[0] + "=" + os.path.join(basePath, libs[0]) + " "
-            compileCommand = compileCommand \
-                        + contractPath + " > " \
-                        + targetPath \
-                        + " --allow-paths " \
-                        + os.path.dirname(inputDir)
-            
-            logging.info("Compiling this contract " + contractName + "... compileCommand: " + str(compileCommand))
-            os.system(compileCommand)
+            versionGroups.setdefault(version, []).append((contractPath, targetPath))
+        if not versionGroups:
+            logging.info('All contracts are compiled already.')
+            return True
+        ## import libs are the same for every contract
+        _, _, importLibs = calculateImportLib(inputDir, contractList, debug)
+        if not os.path.exists(basePath):
+            os.mkdir(basePath)
+        remappings = buildRemappings(importLibs, basePath)
+        ## compile each contract, all solc versions side by side
+        for version, group in versionGroups.items():
+            for contractPath, _ in group:
+                logging.info("Compiling this contract " + contractList[contractPath] + " with solc " + version + "...")
+        failed = compileVersionGroups(versionGroups, remappings, inputDir, debug)
     except Exception as e:
         logging.error('Error compiling DApp.')
         return False
+    if failed:
+        logging.error("Unable to compile %s", ", ".join(os.path.splitext(os.path.basename(targetPath))[0] + ".sol" for targetPath in failed))
+        return False
     
     logging.info('DApp compiled successfully.')
     return True
 
+'''
+#  builds the solc remappings for the import libs of a DApp.
+# Why: The remappings are the same for every contract, so they are built once and shared by all compile commands.
+# Subtleties: Every non-relative import lib is remapped into node_modules; several libs of one package give one remapping.
+# Possible bugs: If an import lib is not installed in node_modules, solc fails to resolve it.
+'''
+def buildRemappings(importLibs, basePath):
+    remappings = dict()
+    for importLib in importLibs:
+        libs = importLib.split("/")
+        if libs[0] == ".":
+            continue
+        remappings[libs[0]] = os.path.join(basePath, libs[0])
+    return [prefix + "=" + target for prefix, target in remappings.items()]
+
+'''
+#  builds the solc argument list for compiling one or more contracts.
+# Why: The list is passed to subprocess.run directly, so no shell re-parses it.
+# Subtleties: remappings come from buildRemappings.
+# Possible bugs: All contracts in one command must compile with the same solc version.
+'''
+def buildCompileCommand(contractPaths, remappings, inputDir):
+    compileCommand = ["solc", "--combined-json", "abi,bin,bin-runtime,srcmap,srcmap-runtime,ast"]
+    compileCommand.extend(remappings)
+    compileCommand.extend(contractPaths)
+    compileCommand.extend(["--allow-paths", os.path.dirname(inputDir)])
+    return compileCommand
+
+'''
+#  collects the source files a contract pulls in, directly or through other imports.
+# Why: isCompiled compares the compiled json against every file the contract compiles.
+# Subtleties: Relative imports are resolved next to the importing file, everything else in node_modules, matching the solc remappings.
+# Possible bugs: Imports that do not exist on disk are kept in the set but not followed.
+'''
+def importClosure(contractPath, basePath):
+    closure = set()
+    stack = [os.path.abspath(contractPath)]
+    while stack:
+        path = stack.pop()
+        if path in closure:
+            continue
+        closure.add(path)
+        if not os.path.isfile(path):
+            continue
+        dirName = os.path.dirname(path)
+        for importFile in parseImportList(path):
+            localPath = os.path.normpath(os.path.join(dirName, importFile))
+            if importFile.startswith(".") or os.path.exists(localPath):
+                stack.append(localPath)
+            else:
+                stack.append(os.path.normpath(os.path.join(basePath, importFile)))
+    return closure
+
+'''
+#  returns whether the compiled json of a contract is newer than the contract and everything it imports.
+# Why: Unchanged contracts are skipped, edited ones are compiled again.
+# Subtleties: An empty json counts as not compiled; imports missing on disk are ignored.
+# Possible bugs: A source copied with its old mtime preserved is not noticed.
+'''
+def isCompiled(contractPath, targetPath, basePath):
+    try:
+        targetStat = os.stat(targetPath)
+    except OSError:
+        return False
+    if not targetStat.st_size:
+        return False
+    for path in importClosure(contractPath, basePath):
+        try:
+            if os.stat(path).st_mtime_ns > targetStat.st_mtime_ns:
+                return False
+        except OSError:
+            continue
+    return True
+
+'''
+#  compiles groups of contracts keyed by solc version and returns the target paths that failed.
+# Why: Contracts of different solc versions can be compiled side by side.
+# Subtleties: Every solc process gets its version through SOLC_VERSION; the cores are split between the groups.
+# Possible bugs: A solc on PATH that is not the solc-select wrapper ignores SOLC_VERSION.
+'''
+def compileVersionGroups(versionGroups, remappings, inputDir, debug=False):
+    solcVersions = dict()
+    for version in versionGroups:
+        solcVersions[version] = VERSION_NUM_RE.search(version).group(0)
+        check_and_install_solc_version(solcVersions[version])
+    workers = os.cpu_count() or 1
+    groupWorkers = min(workers, len(versionGroups))
+    jobWorkers = max(1, workers // len(versionGroups))
+    def run(item):
+        version, group = item
+        return compileVersionGroup(group, remappings, inputDir, debug, solcVersions[version], jobWorkers)
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=groupWorkers) as executor:
+        for groupFailed in executor.map(run, versionGroups.items()):
+            failed.extend(groupFailed)
+    return failed
+
+'''
+#  compiles a group of contracts that share one solc version and returns the target paths that failed.
+# Why: Every contract gets its own solc run, so its json matches a one-file compile.
+# Subtleties: The contracts are compiled concurrently by runCompileCommands.
+# Possible bugs: Without solcVersion, the version selected by solc-select must already match the group.
+'''
+def compileVersionGroup(group, remappings, inputDir, debug=False, solcVersion=None, maxWorkers=None):
+    env = None
+    if solcVersion is not None:
+        env = dict(os.environ, SOLC_VERSION=solcVersion)
+    compileJobs = []
+    for contractPath, targetPath in group:
+        compileJobs.append((buildCompileCommand([contractPath], remappings, inputDir), targetPath))
+    return runCompileCommands(compileJobs, debug, env, maxWorkers)
+
+'''
+#  runs solc compile commands concurrently, writing stdout to their targets, and returns the target paths that failed.
+# Why: Every solc invocation is an independent single-threaded subprocess, so they can run side by side.
+# Subtleties: The target of a failed command is emptied; env (e.g. with SOLC_VERSION) is passed to every command.
+# Possible bugs: The default of one worker per core assumes solc is single-threaded.
+'''
+def runCompileCommands(compileJobs, debug=False, env=None, maxWorkers=None):
+    def run(compileJob):
+        compileCommand, targetPath = compileJob
+        try:
+            with open(targetPath, 'w') as out:
+                completed = subprocess.run(compileCommand, stdout=out, stderr=subprocess.PIPE, env=env)
+                if completed.returncode != 0:
+                    out.truncate(0)
+        except OSError as e:
+            logging.error(f"Unable to run {compileCommand[0]}: {e}")
+            return compileCommand, targetPath, None
+        return compileCommand, targetPath, completed
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers or os.cpu_count()) as executor:
+        for compileCommand, targetPath, completed in executor.map(run, compileJobs):
+            if completed is None or completed.returncode != 0:
+                failed.append(targetPath)
+            if completed is None:
+                continue
+            if completed.returncode != 0:
+                logging.error("Compile command failed: %s\n%s", " ".join(compileCommand), completed.stderr.decode(errors='ignore'))
+            elif debug:
+                logging.info(colored('Compile command finished: ' + " ".join(compileCommand), 'green'))
+    return failed
+
 import subprocess
 
+# solc versions installed by solc-select, read once on first use
+installedSolcVersions = None
+
 def check_and_install_solc_version(version):
-    # Get the installed solc version
-    installed_version = subprocess.check_output(["solc", "--version"]).decode("utf-8")
+    global installedSolcVersions
+    # Get the installed solc versions
+    if installedSolcVersions is None:
+        output = subprocess.check_output(["solc-select", "versions"]).decode("utf-8")
+        installedSolcVersions = set(VERSION_NUM_RE.findall(output))
 
     # Check if the required version is installed
-    if version not in installed_version:
+    if version not in installedSolcVersions:
         # If not, install the required version
         logging.info(f"Version {version} not found. Installing...")
-        subprocess.call(["solc-select", "install", version])
-        subprocess.call(["solc-select", "use", version])
+        if subprocess.run(["solc-select", "install", version]).returncode != 0:
+            logging.error(f"Version {version} could not be installed.")
+            return
+        installedSolcVersions.add(version)
         logging.info(f"Version {version} installed successfully.")
     else:
         logging.info(f"Version {version} is already installed.")
@@ -317,136 +620,141 @@ compile contract
 def compileContract(inputDir, outputDir, targetContract):
     logging.info('Compiling contract...')
     ## get leaf node (contract)
-    nodeList = getLeafNode(inputDir)
+    contractList = parseContractList(inputDir)
+    nodeList = getLeafNode(inputDir, contractList=contractList)
     leafNode = ""
     for path, outDegree in nodeList.items():
         (cPath, cName) = os.path.split(path)
-        cName = cName[:len(cName) - 4]
+        cName = os.path.splitext(cName)[0]
         if cName == targetContract:
             leafNode = path
     # compile leaf node
     if leafNode == "":
         return
     (_, contractName) = os.path.split(leafNode)
-    targetPath = os.path.join(outputDir, contractName[:len(contractName) - 4] + ".json")
+    targetPath = os.path.join(outputDir, os.path.splitext(contractName)[0] + ".json")
     version = parseVersion(leafNode)
     if version == "unknown version":
         logging.error("Unable to identify solidity version of %s", contractName)
         return
-    switchVersion(version)
     basePath = os.path.join(os.path.dirname(inputDir), "node_modules")
     if not os.path.exists(basePath):
         os.mkdir(basePath)
-    _, _, importLibs = calculateImportLib(inputDir)
-    compileCommand = "solc --combined-json abi,bin,bin-runtime,srcmap,srcmap-runtime,ast "
-    for importLib in importLibs:
-        libs = importLib.split("/")
-        if libs[0] == ".":
-            continue
-        compileCommand = compileCommand + libs[0] + "=" + os.path.join(basePath, libs[0]) + " "
-    compileCommand = compileCommand \
-                + leafNode + " > " \
-                + targetPath \
-                + " --allow-paths " \
-                + os.path.dirname(inputDir)
-    os.system(compileCommand)
+    _, _, importLibs = calculateImportLib(inputDir, contractList)
+    remappings = buildRemappings(importLibs, basePath)
+    if compileVersionGroups({version: [(leafNode, targetPath)]}, remappings, inputDir):
+        return
     logging.info('Contract compiled successfully.')
 
 '''
 calculate how many import lib
 '''
-def calculateImportLib(inputDir):
-    logging.info('Calculating how many import lib...')
+def calculateImportLib(inputDir, contractList=None, debug=False):
+    if debug: logging.info(colored('Calculating how many import lib...', 'green'))
     ## get all node (contract)
-    result = parseContractList(inputDir)
-    modulePath = os.path.dirname(inputDir)
-    modulePath = os.path.join(modulePath, "node_modules")
+    result = contractList if contractList is not None else parseContractList(inputDir)
+    edges = buildDependencyEdges(result)
     ## calculate import lib
     libNum = 0
     lib = []
     for path, name in result.items():
-        importFiles = parseImportList(path)
         flag = False
-        for importFile in importFiles:
-            importFile = importFile.replace("'", "")
-            dirName = os.path.dirname(path)
-            if not os.path.exists(os.path.join(dirName, importFile)):
-                    # and not os.path.exists(os.path.join(modulePath, importFile)):
+        for importFile, realPath in edges[path]:
+            ## imports of other contracts are local, no need to stat them
+            if realPath not in result and not os.path.exists(realPath):
                 flag = True
-                # print(os.path.join(modulePath, importFile))
-                # print(os.path.join(dirName, importFile))
                 lib.append(importFile)
         if flag:
             libNum += 1
-    logging.info('Number of import lib calculated successfully.')
+    if debug: logging.info(colored('Number of import lib calculated successfully.', 'green'))
     return libNum, len(result.keys()), list(set(lib))
 
+## parsed pack sources keyed by (real path, node_modules path), stored with the file's (mtime, size)
+packSourceCache = dict()
+
 '''
-get contract string without ''pragma solidity''
+#  returns (pragma, body without pragma and imports, real path of every import or None) of a contract.
+# Why: getPackedContract needs all three for every file it packs.
+# Subtleties: Imports are looked up next to the contract first, then in node_modules; commented-out imports are ignored.
+# Possible bugs: If there is no pragma, None is returned as version and the contract cannot be packed.
 '''
-def getPackedContract(contractPath, nodeModulePath):
-    logging.info('Getting contract string without ''pragma solidity''...')
-    f = open(contractPath, 'r')
-    contractStringWithVersion = f.read()
-    f.close()
-    versionPattern = 'pragma solidity [\S]*;'
-    versionString = re.search(versionPattern, contractStringWithVersion)
-    if versionString == None:
-        return "failed", "failed"
-    versionString = versionString.group()
-    contractStringWithoutVersion = re.sub(versionPattern, '', contractStringWithVersion)
-
-    result = ""
-
-    importPattern1 = 'import[\s]*([\S]*);'
-    importItem = re.search(importPattern1, contractStringWithoutVersion)
-    while importItem != None:
-        contractStringWithoutVersion = re.sub(importPattern1, '', contractStringWithoutVersion)
-        targetPath1 = os.path.join(contractPath, importItem.group(1))
-        targetPath2 = os.path.join(nodeModulePath, importItem.group(1))
-        importItem = re.search(importPattern1, contractStringWithoutVersion)
-        if os.path.exists(targetPath1):
-            tempVersion, tempresult =  getPackedContract(targetPath1, nodeModulePath)
-            if tempVersion == "failed":
-                return "failed", "failed"
-            result = result + tempresult
-        elif os.path.exists(targetPath2):
-            tempVersion, tempresult =  getPackedContract(targetPath2, nodeModulePath)
-            if tempVersion == "failed":
-                return "failed", "failed"
-            result = result + tempresult
-        else:
-            return "failed", "failed"
-
-    importPattern2 = 'import[\s]*[\S]*[\s]*from[\s]*([\S]*);'
-    importItem = re.search(importPattern2, contractStringWithoutVersion)
-    result = ""
-    while importItem != None:
-        contractStringWithoutVersion = re.sub(importPattern2, '', contractStringWithoutVersion)
-        targetPath1 = os.path.join(contractPath, importItem.group(1))
-        targetPath2 = os.path.join(nodeModulePath, importItem.group(1))
-        importItem = re.search(importPattern2, contractStringWithoutVersion)
+def parsePackSource(contractPath, nodeModulePath):
+    with open(contractPath, 'r') as f:
+        contractString = f.read()
+    ## collect the pragma and import spans in one scan and cut them out with a single join
+    versionString = None
+    body = []
+    targets = []
+    last = 0
+    for item in PACK_RE.finditer(contractString):
+        ## comments stay in the body; matching them only keeps commented-out imports from being cut
+        if item.group(1) is not None:
+            continue
+        body.append(contractString[last:item.start()])
+        last = item.end()
+        if item.group(2) is not None:
+            if versionString is None:
+                versionString = item.group(2)
+            continue
+        targetPath1 = os.path.join(os.path.dirname(contractPath), item.group(3))
+        targetPath2 = os.path.join(nodeModulePath, item.group(3))
         if os.path.exists(targetPath1):
-            tempVersion, tempresult =  getPackedContract(targetPath1, nodeModulePath)
-            if tempVersion == "failed":
-                return "failed", "failed"
-            result = result + tempresult
+            targets.append(cachedRealPath(targetPath1))
         elif os.path.exists(targetPath2):
-            tempVersion, tempresult =  getPackedContract(targetPath2, nodeModulePath)
-            if tempVersion == "failed":
-                return "failed", "failed"
-            result = result + tempresult
+            targets.append(cachedRealPath(targetPath2))
         else:
-            return "failed", "failed"
+            targets.append(None)
+    if versionString is None:
+        return None, "", []
+    body.append(contractString[last:])
+    return versionString, "".join(body), targets
 
-    result = result + contractStringWithoutVersion
-    return versionString, result
+'''
+#  gets contract string without ''pragma solidity'', with every imported contract placed before its importer.
+# Why: A packed contract can be compiled or verified as a single file.
+# Subtleties: The import graph is walked depth-first with an explicit stack, emitting every file once.
+# Possible bugs: On an import cycle the file closing the cycle is emitted after the one importing it.
+'''
+def getPackedContract(contractPath, nodeModulePath, debug=False):
+    if debug: logging.info(colored('Getting contract string without ''pragma solidity''...', 'green'))
+    def load(path):
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = packSourceCache.get((path, nodeModulePath))
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, parsePackSource(path, nodeModulePath))
+            packSourceCache[(path, nodeModulePath)] = cached
+        return cached[1]
+    rootPath = cachedRealPath(contractPath)
+    rootSource = load(rootPath)
+    if rootSource[0] is None or None in rootSource[2]:
+        return "failed", "failed"
+    ## files pushed so far; each is parsed once, when it is pushed
+    seen = {rootPath}
+    order = []
+    stack = [(rootSource, 0)]
+    while stack:
+        source, index = stack[-1]
+        _, body, targets = source
+        if index < len(targets):
+            stack[-1] = (source, index + 1)
+            target = targets[index]
+            if target not in seen:
+                seen.add(target)
+                targetSource = load(target)
+                if targetSource[0] is None or None in targetSource[2]:
+                    return "failed", "failed"
+                stack.append((targetSource, 0))
+            continue
+        order.append(body)
+        stack.pop()
+    return rootSource[0], "".join(order)
 
 
 '''
 get packed leaf contracts
 '''
-def getPacked(inputDir, outputDir):
+def getPacked(inputDir, outputDir, debug=False):
     ## get node_modules path
     nodeModulePath = os.path.join(os.path.dirname(inputDir), "node_modules")
     ## get leaf node (contract)
@@ -459,9 +767,9 @@ def getPacked(inputDir, outputDir):
     for leafNode in leafNodes:
         (contractPath, contractName) = os.path.split(leafNode)
         contractPath = os.path.join(contractPath, contractName)
-        contractName = contractName[:len(contractName) - 4]
+        contractName = os.path.splitext(contractName)[0]
         targetPath = os.path.join(outputDir, contractName + "_packed.sol")
-        version, contract = getPackedContract(contractPath, nodeModulePath)
+        version, contract = getPackedContract(contractPath, nodeModulePath, debug)
         if version == "failed":
             continue
         packedLeafNode = version + "\n" + contract